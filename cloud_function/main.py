@@ -26,23 +26,51 @@ Deployment:
         --timeout=300s
 
 Environment variables:
-    PROJECT_ID, DATASET_ID, GCS_LOGS_PREFIX
+    PROJECT_ID, DATASET_ID, GCS_LOGS_PREFIX, COMPUTE_FINGERPRINT,
+    ARCHIVE_ENABLED, DOWNLOAD_CHUNK_SIZE, LEDGER_OVERLAP_MAX_BYTES,
+    PROCESSED_MARKER_ENABLED
 """
 
 import functions_framework
 from google.cloud import bigquery
 from google.cloud import storage
+import gzip
+import io
 import json
-import re
 import logging
 import os
 import hashlib
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
 from pathlib import Path
-from typing import Optional, Dict, Any, List, Tuple
-
-# Configure logging
-logging.basicConfig(level=logging.INFO)
+from typing import Optional, Dict, Any, Iterable, Iterator, List, Tuple, Union
+
+# orjson is preferred over pysimdjson here: every row reads nearly all of its
+# keys, so simdjson's lazy per-key access saves nothing, and a reused
+# simdjson.Parser invalidates the previous document on each parse.
+try:
+    import orjson
+    _json_loads = orjson.loads
+    _json_dumps = orjson.dumps
+except ImportError:  # orjson is optional; fall back to the stdlib parser
+    orjson = None
+    _json_loads = json.loads
+
+    def _json_dumps(obj: Any) -> bytes:
+        return json.dumps(obj, separators=(",", ":")).encode("utf-8")
+
+try:
+    from google.cloud import logging as cloud_logging
+except ImportError:  # only needed for structured logs on Cloud Functions
+    cloud_logging = None
+
+# Configure logging. On Cloud Functions (K_SERVICE is set) records go through
+# Cloud Logging's structured handler, so ``extra={"json_fields": ...}`` lands
+# as queryable jsonPayload keys; locally plain text logging is used.
+if cloud_logging is not None and os.getenv("K_SERVICE"):
+    cloud_logging.Client(project=os.getenv("PROJECT_ID")).setup_logging(log_level=logging.INFO)
+else:
+    logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # =============================================================================
@@ -56,6 +84,20 @@ ARCHIVE_TABLE = os.getenv("ARCHIVE_TABLE", "archive_ftplog")
 PROCESSED_TABLE = os.getenv("PROCESSED_TABLE", "processed_files")
 GCS_LOGS_PREFIX = os.getenv("GCS_LOGS_PREFIX", "logs")
 
+# hash_fingerprint is what the scheduled ETL dedupes against; deployments
+# that only load through this function can set COMPUTE_FINGERPRINT=0 to
+# skip the per-row SHA256
+COMPUTE_FINGERPRINT = os.getenv("COMPUTE_FINGERPRINT", "1") == "1"
+
+# archive_ftplog is the permanent raw-event copy; ARCHIVE_ENABLED=0 skips
+# building and loading archive rows for deployments that archive elsewhere
+ARCHIVE_ENABLED = os.getenv("ARCHIVE_ENABLED", "1") == "1"
+
+# The GCS processed marker is written with an object metadata patch, which
+# needs storage.objects.update on the bucket. The documented role is read-only
+# (objectViewer), so it is opt-in; without it the ledger alone decides.
+PROCESSED_MARKER_ENABLED = os.getenv("PROCESSED_MARKER_ENABLED", "0") == "1"
+
 # Fully qualified table names
 FQ_BASE_TABLE = f"{PROJECT_ID}.{DATASET_ID}.{BASE_TABLE}"
 FQ_ARCHIVE_TABLE = f"{PROJECT_ID}.{DATASET_ID}.{ARCHIVE_TABLE}"
@@ -64,14 +106,71 @@ FQ_PROCESSED_TABLE = f"{PROJECT_ID}.{DATASET_ID}.{PROCESSED_TABLE}"
 # SQL file for scheduled ETL (HTTP-triggered function)
 SCHEDULED_SQL_PATH = Path(__file__).parent / "etl_sql.sql"
 
-# File pattern to process (only files in logs/ prefix with .json extension)
-FILE_PATTERN = rf"^{re.escape(GCS_LOGS_PREFIX)}/.*\.json$"
+# The SQL ships with the deployment and never changes on a running instance,
+# so it is read once at import rather than on every request
+try:
+    SCHEDULED_SQL: Optional[str] = SCHEDULED_SQL_PATH.read_text()
+except FileNotFoundError:
+    SCHEDULED_SQL = None
+
+# Window and billing cap for the latest-snapshot lookup in run_monitoring_alert
+MONITORING_LOOKBACK_HOURS = 24
+MONITORING_MAX_BYTES_BILLED = 100 * 1024 * 1024
+
+# Size of each ranged GCS read when streaming an object line by line. Each
+# chunk is one HTTP request, so larger chunks mean fewer round trips while
+# memory stays bounded by the chunk rather than the file.
+DOWNLOAD_CHUNK_SIZE = int(os.getenv("DOWNLOAD_CHUNK_SIZE", str(8 * 1024 * 1024)))
+
+# Objects up to this size are streamed while the processed_files ledger query
+# runs in the background; larger ones wait for the query first, so replays of
+# big files download nothing
+LEDGER_OVERLAP_MAX_BYTES = int(os.getenv("LEDGER_OVERLAP_MAX_BYTES", str(1024 * 1024)))
+
+# How often (in lines) process_ftplog checks whether the background ledger
+# query has finished, so redelivered files stop streaming early
+LEDGER_POLL_LINES = 1000
+
+# Custom object metadata keys set on a blob once it has been loaded, so that
+# redelivered events can be skipped without querying the processed_files ledger.
+# The marker records the object generation it was written for, because copies
+# (``gsutil cp``, rewrites) carry custom metadata over to a new object.
+PROCESSED_METADATA_KEY = "processed"
+PROCESSED_GENERATION_METADATA_KEY = "processed_generation"
+
+# Files to process (only files in logs/ prefix with .json or gzip-compressed
+# .json.gz extension). Plain prefix/suffix checks are used instead of a regex
+# on the hot path.
+FILE_PREFIX = f"{GCS_LOGS_PREFIX}/"
+FILE_SUFFIXES = (".json", ".json.gz")
+
+
+# Clients are created lazily and reused across warm invocations of the same
+# instance, avoiding credential discovery and HTTP session setup per event
+_bq_client: Optional[bigquery.Client] = None
+_storage_client: Optional[storage.Client] = None
 
 
 # =============================================================================
 # Helper Functions
 # =============================================================================
 
+def get_bq_client() -> bigquery.Client:
+    """Return the instance-wide BigQuery client, creating it on first use."""
+    global _bq_client
+    if _bq_client is None:
+        _bq_client = bigquery.Client(project=PROJECT_ID)
+    return _bq_client
+
+
+def get_storage_client() -> storage.Client:
+    """Return the instance-wide Storage client, creating it on first use."""
+    global _storage_client
+    if _storage_client is None:
+        _storage_client = storage.Client(project=PROJECT_ID)
+    return _storage_client
+
+
 def extract_originating_filename(gcs_uri: str) -> str:
     """Extract the originating filename (without extension) from a GCS URI.
 
@@ -80,22 +179,29 @@ def extract_originating_filename(gcs_uri: str) -> str:
             "gs://bucket/logs/myfile.json" or "logs/myfile.json").
 
     Returns:
-        The filename without the ``.json`` extension if present, otherwise
-        the string ``"unknown"``.
+        The filename without the ``.json`` or ``.json.gz`` extension if
+        present, otherwise the string ``"unknown"``.
 
     Examples:
         >>> extract_originating_filename('gs://bucket/logs/foo.json')
         'foo'
+        >>> extract_originating_filename('gs://bucket/logs/foo.json.gz')
+        'foo'
     """
-    match = re.search(r'/([^/]+)\.json$', gcs_uri)
-    return match.group(1) if match else "unknown"
+    _, sep, basename = gcs_uri.rpartition("/")
+    if sep:
+        for suffix in FILE_SUFFIXES:
+            if len(basename) > len(suffix) and basename.endswith(suffix):
+                return basename[:-len(suffix)]
+    return "unknown"
 
 
 def parse_event_timestamp(event_dt_str: Optional[str]) -> Optional[datetime]:
     """Parse an ISO 8601 timestamp string into a ``datetime`` object.
 
-    The function handles several common ISO 8601 variants with and without
-    fractional seconds and trailing ``Z`` UTC designator. If the input is
+    Uses ``datetime.fromisoformat``, which on Python 3.11+ accepts the ISO
+    8601 variants seen in the logs (with or without fractional seconds and a
+    trailing ``Z`` UTC designator) in a single C-level call. If the input is
     falsy or cannot be parsed, ``None`` is returned.
 
     Args:
@@ -107,21 +213,12 @@ def parse_event_timestamp(event_dt_str: Optional[str]) -> Optional[datetime]:
     if not event_dt_str:
         return None
 
-    # Handle various ISO 8601 formats
-    formats = [
-        "%Y-%m-%dT%H:%M:%S",
-        "%Y-%m-%dT%H:%M:%S.%f",
-        "%Y-%m-%dT%H:%M:%SZ",
-        "%Y-%m-%dT%H:%M:%S.%fZ",
-    ]
-
-    for fmt in formats:
-        try:
-            return datetime.strptime(event_dt_str, fmt)
-        except ValueError:
-            continue
+    try:
+        return datetime.fromisoformat(event_dt_str)
+    except (TypeError, ValueError):
+        pass
 
-    logger.warning(f"Could not parse timestamp: {event_dt_str}")
+    logger.warning("Could not parse timestamp: %s", event_dt_str)
     return None
 
 
@@ -139,6 +236,9 @@ def safe_int(value: Any) -> Optional[int]:
     """
     if value is None:
         return None
+    # JSON numbers already decode to int; skip the try/int() round trip
+    if type(value) is int:
+        return value
     try:
         return int(value)
     except (ValueError, TypeError):
@@ -159,71 +259,96 @@ def compute_hash_fingerprint(data: Dict[str, Any]) -> str:
 
     Returns:
         Hexadecimal SHA256 fingerprint string.
+
+    Note:
+        SHA256 must stay in step with ``TO_HEX(SHA256(...))`` in the
+        scheduled ETL SQL so rows loaded by either path dedupe against each
+        other. The canonical string is built with one f-string rather than a
+        list of ``str()`` calls and a join.
     """
-    canonical = "|".join([
-        str(data.get("EventDt") or ""),
-        str(data.get("Source") or ""),
-        str(data.get("Filename") or ""),
-        str(data.get("Bytes") or ""),
-        str(data.get("UserName") or ""),
-    ])
+    get = data.get
+    canonical = (
+        f"{get('EventDt') or ''}|{get('Source') or ''}|{get('Filename') or ''}|"
+        f"{get('Bytes') or ''}|{get('UserName') or ''}"
+    )
     return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
 
 
-def parse_json_line(line: str, gcs_uri: str, originating_filename: str) -> Tuple[Optional[Dict], Dict]:
+def _line_text(line: Union[bytes, str]) -> str:
+    """Return an NDJSON line as text, replacing invalid UTF-8 sequences."""
+    return line.decode("utf-8", errors="replace") if isinstance(line, bytes) else line
+
+
+def parse_json_line(
+    line: Union[bytes, str],
+    gcs_uri: str,
+    originating_filename: str,
+    load_time_iso: Optional[str] = None,
+    include_archive: bool = True
+) -> Tuple[Optional[Dict], Optional[Dict]]:
     """Parse a single NDJSON line and produce rows for base and archive tables.
 
-    The function always returns an ``archive_row`` containing the original
-    raw JSON and metadata. If the JSON line can be parsed and contains
-    expected fields, a structured ``base_row`` dictionary is also returned.
-    On JSON parse failure, ``base_row`` is ``None`` and only the
-    ``archive_row`` is provided.
+    Unless ``include_archive`` is false, the function returns an
+    ``archive_row`` containing the original raw JSON and metadata. If the
+    JSON line can be parsed and contains expected fields, a structured
+    ``base_row`` dictionary is also returned. On JSON parse failure,
+    ``base_row`` is ``None`` and only the ``archive_row`` is provided.
 
     Args:
-        line: A single line of NDJSON (string).
+        line: A single line of NDJSON. Raw ``bytes`` are parsed directly and
+            only decoded once for the archive copy.
         gcs_uri: The full GCS URI for the source file.
         originating_filename: The extracted filename (without extension) used
             as a load identifier.
+        load_time_iso: ISO 8601 load timestamp shared by every row of the
+            file. Computed per call when omitted.
+        include_archive: When false, no archive row is built and
+            ``archive_row`` is ``None``.
 
     Returns:
         A tuple ``(base_row, archive_row)`` where ``base_row`` is a mapping
         suitable for insertion into ``base_ftplog`` (or ``None`` on parse
         failure), and ``archive_row`` is a mapping suitable for
-        insertion into ``archive_ftplog``.
+        insertion into ``archive_ftplog`` (or ``None`` when disabled).
     """
-    load_time = datetime.utcnow()
+    if load_time_iso is None:
+        load_time_iso = datetime.now(timezone.utc).isoformat()
     
-    # Archive row always includes the raw JSON
-    archive_row = {
-        "raw_json": line,
-        "archived_timestamp": load_time.isoformat(),
-        "process_dt": load_time.isoformat(),
-        "originating_filename": originating_filename,
-        "gcs_uri": gcs_uri,
-    }
+    # Archive row includes the raw JSON
+    archive_row = None
+    if include_archive:
+        archive_row = {
+            "raw_json": _line_text(line),
+            "archived_timestamp": load_time_iso,
+            "process_dt": load_time_iso,
+            "originating_filename": originating_filename,
+            "gcs_uri": gcs_uri,
+        }
     
     # Try to parse JSON for base table
     try:
-        data = json.loads(line)
-    except json.JSONDecodeError as e:
-        logger.warning(f"JSON parse error: {e} - Line: {line[:100]}...")
+        data = _json_loads(line)
+    except ValueError as e:
+        # Both orjson.JSONDecodeError and json.JSONDecodeError subclass ValueError
+        logger.warning("JSON parse error: %s - Line: %.100s...", e, _line_text(line))
         return None, archive_row
     
     # Parse event timestamp
     event_dt = parse_event_timestamp(data.get("EventDt"))
+    event_dt_iso = event_dt.isoformat() if event_dt else None
     
     base_row = {
-        "load_time_dt": load_time.isoformat(),
-        "source_file_dt": event_dt.isoformat() if event_dt else load_time.isoformat(),
+        "load_time_dt": load_time_iso,
+        "source_file_dt": event_dt_iso or load_time_iso,
         "originating_filename": originating_filename,
         "gcs_uri": gcs_uri,
         "action": data.get("Action"),
         "bytes": safe_int(data.get("Bytes")),
         "cust_id": safe_int(data.get("CustId")),
-        "event_dt": event_dt.isoformat() if event_dt else None,
+        "event_dt": event_dt_iso,
         "filename": data.get("Filename"),
         "hash_code": safe_int(data.get("HashCode")),
-        "hash_fingerprint": compute_hash_fingerprint(data),
+        "hash_fingerprint": compute_hash_fingerprint(data) if COMPUTE_FINGERPRINT else None,
         "ip_address": data.get("IpAddress"),
         "partner_name": data.get("PartnerName"),
         "session_id": data.get("SessionId"),
@@ -237,6 +362,101 @@ def parse_json_line(line: str, gcs_uri: str, originating_filename: str) -> Tuple
     return base_row, archive_row
 
 
+def iter_blob_lines(
+    blob: storage.Blob,
+    chunk_size: int = DOWNLOAD_CHUNK_SIZE
+) -> Iterator[bytes]:
+    """Yield the lines of a GCS object without buffering the whole file.
+
+    The object is read in ranged chunks of ``chunk_size`` bytes and split
+    into lines as each chunk arrives, so peak memory is bounded by the chunk
+    rather than the file and parsing starts before the download finishes.
+    ``BlobReader`` has no ``peek()``, so iterating it directly would fall
+    back to one-byte reads; lines are split from whole chunks instead.
+
+    Gzip data is decompressed on the fly, both for ``.gz`` objects and for
+    objects uploaded with ``Content-Encoding: gzip`` (``gsutil cp -Z``, which
+    may keep a plain ``.json`` name). The object is always read with
+    ``raw_download=True``: GCS ignores ``Range`` on decompressively
+    transcoded responses, so ranged reads must fetch the stored bytes.
+
+    Args:
+        blob: Blob to read. When it was fetched with ``get_blob`` its
+            generation is pinned, so every chunk reads the same object.
+        chunk_size: Bytes requested from GCS per read.
+
+    Yields:
+        Each line as ``bytes`` without its line terminator.
+    """
+    remainder = b""
+    with blob.open("rb", chunk_size=chunk_size, raw_download=True) as raw:
+        if blob.name.endswith(".gz") or blob.content_encoding == "gzip":
+            reader = gzip.GzipFile(fileobj=raw, mode="rb")
+        else:
+            reader = raw
+        while True:
+            chunk = reader.read(chunk_size)
+            if not chunk:
+                break
+            buf = remainder + chunk
+            # Only complete lines are emitted; the tail waits for more data
+            cut = buf.rfind(b"\n") + 1
+            if cut:
+                yield from buf[:cut].splitlines()
+            remainder = buf[cut:]
+    if remainder:
+        yield from remainder.splitlines()
+
+
+def is_marked_processed(blob: storage.Blob) -> bool:
+    """Return whether a blob carries the processed marker in its metadata.
+
+    The marker is written by ``mark_processed`` after a successful load and
+    only counts when it names this blob's generation, so an object copied
+    from an already processed one is not skipped. A missing marker does not
+    prove the file is new (it may predate the marker or have been loaded by
+    the scheduled ETL), so callers must still fall back to
+    ``is_already_processed``. Only consulted when ``PROCESSED_MARKER_ENABLED``
+    is set; the ledger, used otherwise, is keyed by URI, not generation.
+
+    Args:
+        blob: Blob whose metadata has been fetched (for example via
+            ``Bucket.get_blob``).
+
+    Returns:
+        ``True`` if the processed marker for this generation is present,
+        otherwise ``False``.
+    """
+    metadata = blob.metadata or {}
+    return (
+        metadata.get(PROCESSED_METADATA_KEY) == "true"
+        and metadata.get(PROCESSED_GENERATION_METADATA_KEY) == str(blob.generation)
+    )
+
+
+def mark_processed(blob: storage.Blob, processed_at: str) -> None:
+    """Record the processed marker in the blob's custom metadata.
+
+    This is best-effort: the ``processed_files`` ledger remains the source of
+    truth, so a failed patch (for example when the service account lacks
+    ``storage.objects.update``) is logged and otherwise ignored.
+
+    Args:
+        blob: Blob that was just loaded into BigQuery.
+        processed_at: ISO 8601 timestamp of the load.
+    """
+    blob.metadata = {
+        **(blob.metadata or {}),
+        PROCESSED_METADATA_KEY: "true",
+        PROCESSED_GENERATION_METADATA_KEY: str(blob.generation),
+        "processed_at": processed_at,
+    }
+    try:
+        blob.patch()
+    except Exception as exc:
+        logger.warning("Could not mark %s as processed: %s", blob.name, exc)
+
+
 def is_already_processed(client: bigquery.Client, gcs_uri: str) -> bool:
     """Return whether a given GCS URI has already been recorded as processed.
 
@@ -266,63 +486,147 @@ def is_already_processed(client: bigquery.Client, gcs_uri: str) -> bool:
     return len(results) > 0
 
 
+def start_load_job(
+    client: bigquery.Client,
+    table: str,
+    rows: List[Dict]
+) -> bigquery.LoadJob:
+    """Append rows to a table with a single NDJSON batch load job.
+
+    The rows are serialized into an in-memory NDJSON buffer and uploaded in
+    one request, so BigQuery ingests the whole file server-side instead of
+    receiving one streaming insert per batch. Each call counts against the
+    per-table daily load-job quota (1,500, failed jobs included), which caps
+    how many files a day this function can load; see "Load job quota" in
+    the README.
+
+    Args:
+        client: Initialized ``google.cloud.bigquery.Client``.
+        table: Fully qualified destination table ID.
+        rows: JSON-serializable mappings whose keys match the table columns.
+
+    Returns:
+        The started ``LoadJob``; call ``result()`` to wait for completion.
+    """
+    buf = io.BytesIO()
+    for row in rows:
+        buf.write(_json_dumps(row))
+        buf.write(b"\n")
+    buf.seek(0)
+
+    job_config = bigquery.LoadJobConfig(
+        source_format=bigquery.SourceFormat.NEWLINE_DELIMITED_JSON,
+        write_disposition=bigquery.WriteDisposition.WRITE_APPEND,
+    )
+    return client.load_table_from_file(buf, table, job_config=job_config)
+
+
+def cancel_load_jobs(jobs: Iterable[bigquery.LoadJob]) -> None:
+    """Request cancellation of load jobs started alongside a failed one.
+
+    Cancellation is best-effort: a job that already completed keeps its rows
+    (see SCENARIO 2 in ``sql/runbook_reprocessing.sql``), and a failed cancel
+    request is only logged so the original load error is what gets raised.
+
+    Args:
+        jobs: Load jobs started by ``start_load_job``.
+    """
+    for job in jobs:
+        try:
+            job.cancel()
+        except Exception as exc:
+            logger.warning("Could not cancel load job %s: %s", job.job_id, exc)
+
+
 def load_to_bigquery(
     client: bigquery.Client,
     base_rows: List[Dict],
     archive_rows: List[Dict],
     gcs_uri: str,
-    originating_filename: str
+    originating_filename: str,
+    rows_expected: Optional[int] = None
 ) -> str:
-    """Insert parsed rows into BigQuery and record processing metadata.
+    """Load parsed rows into BigQuery and record processing metadata.
 
-    The function performs three actions in sequence:
-    1. Insert structured rows into the ``base`` table (if any).
-    2. Insert raw rows into the ``archive`` table (if any).
+    The function performs three actions:
+    1. Start a batch load job for structured rows into the ``base`` table
+       (if any).
+    2. Start a batch load job for raw rows into the ``archive`` table (if
+       any), then wait for both jobs, which run concurrently.
     3. Write a summary row into the ``processed_files`` ledger recording
        counts, status and processing duration.
 
-    On any insertion error into the primary tables, an exception is raised to
+    On any load error into the primary tables, an exception is raised to
     allow the caller to handle retries and error recording.
 
     Args:
-        client: Initialized ``google.cloud.bigquery.Client`` used to insert
-            and write the processed_files ledger.
-        base_rows: List of structured rows to insert into ``base_ftplog``.
-        archive_rows: List of raw JSON rows to insert into ``archive_ftplog``.
+        client: Initialized ``google.cloud.bigquery.Client`` used to load
+            rows and write the processed_files ledger.
+        base_rows: List of structured rows to load into ``base_ftplog``.
+        archive_rows: List of raw JSON rows to load into ``archive_ftplog``.
         gcs_uri: Full GCS URI of the processed file.
         originating_filename: Filename identifier used in the processed_files
             ledger.
+        rows_expected: Number of non-empty lines in the file. Defaults to
+            ``len(archive_rows)``; must be passed when archiving is disabled.
 
     Returns:
         A string status value ("SUCCESS", "PARTIAL", or "FAILED")
         describing the outcome.
 
     Raises:
-        Exception: If inserts into the base or archive tables fail, or if the
+        Exception: If loads into the base or archive tables fail, or if the
             processed_files ledger insert fails.
     """
-    start_time = datetime.utcnow()
+    start_time = datetime.now(timezone.utc)
 
-    # Insert into base table
+    # Start both loads before waiting on either; they have no dependency on
+    # each other, so their payload uploads overlap and BigQuery runs the jobs
+    # concurrently
+    loads = []
     if base_rows:
-        errors = client.insert_rows_json(FQ_BASE_TABLE, base_rows)
-        if errors:
-            logger.error(f"Base table insert errors: {errors}")
-            raise Exception(f"Failed to insert into base table: {errors}")
-
-    # Insert into archive table
+        loads.append(("base", FQ_BASE_TABLE, base_rows))
     if archive_rows:
-        errors = client.insert_rows_json(FQ_ARCHIVE_TABLE, archive_rows)
-        if errors:
-            logger.error(f"Archive table insert errors: {errors}")
-            raise Exception(f"Failed to insert into archive table: {errors}")
+        loads.append(("archive", FQ_ARCHIVE_TABLE, archive_rows))
+
+    with ThreadPoolExecutor(max_workers=max(len(loads), 1)) as pool:
+        starts = [
+            (label, pool.submit(start_load_job, client, table, rows))
+            for label, table, rows in loads
+        ]
+
+    # Resolve every start before acting on a failure: if one load fails the
+    # other jobs are cancelled, so a FAILED file does not leave rows behind in
+    # the other table. All starts have finished once the pool above exits.
+    jobs = {}
+    start_error = None
+    for label, start in starts:
+        try:
+            jobs[label] = start.result()
+        except Exception as exc:
+            logger.error("%s table load could not be started: %s", label.capitalize(), exc)
+            if start_error is None:
+                start_error = (label, exc)
+    if start_error is not None:
+        cancel_load_jobs(jobs.values())
+        label, exc = start_error
+        raise Exception(f"Failed to load into {label} table: {exc}") from exc
+
+    for label, job in jobs.items():
+        try:
+            job.result()
+        except Exception as exc:
+            logger.error("%s table load errors: %s", label.capitalize(), job.errors)
+            cancel_load_jobs(other for other in jobs.values() if other is not job)
+            raise Exception(f"Failed to load into {label} table: {exc}") from exc
 
     # Calculate processing duration
-    end_time = datetime.utcnow()
+    end_time = datetime.now(timezone.utc)
     duration_seconds = (end_time - start_time).total_seconds()
 
     # Record in processed_files
-    rows_expected = len(archive_rows)
+    if rows_expected is None:
+        rows_expected = len(archive_rows)
     rows_loaded = len(base_rows)
     parse_errors = max(rows_expected - rows_loaded, 0)
     status = "SUCCESS" if parse_errors == 0 and rows_loaded > 0 else "PARTIAL"
@@ -350,7 +654,7 @@ def load_to_bigquery(
 
     errors = client.insert_rows_json(FQ_PROCESSED_TABLE, processed_row)
     if errors:
-        logger.error(f"Processed files insert errors: {errors}")
+        logger.error("Processed files insert errors: %s", errors)
         raise Exception(f"Failed to record processed file: {errors}")
 
     return status
@@ -367,14 +671,17 @@ def process_ftplog(cloud_event):
 
     This function is executed when a new object is finalized in the configured
     GCS bucket. It performs the following steps:
-    1. Validates the object path matches the configured file pattern.
-    2. Skips placeholders and already-processed files (idempotency check).
-    3. Downloads the NDJSON content, parses each line and builds rows for
-       both the structured ``base`` table and the raw ``archive`` table.
+    1. Validates the object path matches the configured file pattern
+       (which excludes placeholders).
+    2. Skips already-processed files (idempotency check),
+       using the blob's processed metadata marker before the ledger query.
+    3. Streams the NDJSON content as bytes, parses each line and builds rows for
+       both the structured ``base`` table and the raw ``archive`` table. The
+       ledger query runs concurrently with this step.
     4. Calls ``load_to_bigquery`` to persist rows and record processing
        metadata in ``processed_files``.
 
-    Any insert errors into BigQuery cause the function to attempt to record
+    Any load errors into BigQuery cause the function to attempt to record
     a failure row in the ``processed_files`` table before re-raising the
     exception so that Cloud Functions/Cloud Logging can surface the failure.
 
@@ -391,55 +698,100 @@ def process_ftplog(cloud_event):
     name = data["name"]
     gcs_uri = f"gs://{bucket}/{name}"
     
-    logger.info(f"Processing file: {gcs_uri}")
-    
-    # Check if this is a file we should process
-    if not re.match(FILE_PATTERN, name):
-        logger.info(f"Skipping non-target file: {name}")
-        return
+    # Structured log fields. Handlers may format records after this function
+    # moves on, so each log call gets its own dict and log_fields is rebound
+    # rather than mutated.
+    log_fields = {"gcs_uri": gcs_uri}
+    logger.info("Processing file: %s", gcs_uri, extra={"json_fields": log_fields})
     
-    # Skip placeholder files
-    if name.endswith(".placeholder"):
-        logger.info(f"Skipping placeholder file: {name}")
+    # Check if this is a file we should process. The suffix check also
+    # rejects ``.placeholder`` objects, so no separate check is needed.
+    if not (name.startswith(FILE_PREFIX) and name.endswith(FILE_SUFFIXES)):
+        logger.info("Skipping non-target file: %s", name)
         return
     
-    # Initialize clients
-    bq_client = bigquery.Client(project=PROJECT_ID)
-    storage_client = storage.Client(project=PROJECT_ID)
+    # Reuse clients across warm invocations
+    bq_client = get_bq_client()
+    storage_client = get_storage_client()
     
-    # Check if already processed (idempotency)
-    if is_already_processed(bq_client, gcs_uri):
-        logger.info(f"File already processed: {gcs_uri}")
+    # Fetch object metadata; when enabled, the processed marker lets
+    # redelivered events skip the ledger query entirely
+    blob = storage_client.bucket(bucket).get_blob(name)
+    if blob is None:
+        logger.info("File no longer exists: %s", gcs_uri)
+        return
+    if PROCESSED_MARKER_ENABLED and is_marked_processed(blob):
+        logger.info("File already processed (metadata marker): %s", gcs_uri)
         return
     
     # Extract metadata
     originating_filename = extract_originating_filename(gcs_uri)
-    logger.info(f"Originating filename: {originating_filename}")
+    logger.info("Originating filename: %s", originating_filename)
     
-    # Read file from GCS
-    bucket_obj = storage_client.bucket(bucket)
-    blob = bucket_obj.blob(name)
-    content = blob.download_as_text(encoding="utf-8")
     
     # Parse lines
     base_rows = []
     archive_rows = []
+    rows_expected = 0
     parse_errors = 0
+    load_time_iso = datetime.now(timezone.utc).isoformat()
+    
+    # Idempotency: objects larger than LEDGER_OVERLAP_MAX_BYTES wait for the
+    # ledger query before the reader is opened, so a redelivery downloads
+    # nothing. Smaller objects cost less to read than the query takes, so the
+    # query runs in the background while they stream and parse, and is
+    # polled every LEDGER_POLL_LINES lines to stop early.
+    overlap_ledger = blob.size is not None and blob.size <= LEDGER_OVERLAP_MAX_BYTES
+    if not overlap_ledger and is_already_processed(bq_client, gcs_uri):
+        logger.info("File already processed: %s", gcs_uri)
+        return
     
-    for line in content.strip().split("\n"):
-        line = line.strip()
-        if not line:
-            continue
+    already_processed = False
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        ledger_check = (
+            pool.submit(is_already_processed, bq_client, gcs_uri) if overlap_ledger else None
+        )
         
-        base_row, archive_row = parse_json_line(line, gcs_uri, originating_filename)
+        # Stream the file from GCS as bytes; orjson parses bytes without an
+        # intermediate str decode
+        for line in iter_blob_lines(blob):
+            line = line.strip()
+            if not line:
+                continue
+            rows_expected += 1
+            if (
+                ledger_check is not None
+                and rows_expected % LEDGER_POLL_LINES == 0
+                and ledger_check.done()
+            ):
+                already_processed = ledger_check.result()
+                if already_processed:
+                    break
+            
+            base_row, archive_row = parse_json_line(
+                line, gcs_uri, originating_filename, load_time_iso,
+                include_archive=ARCHIVE_ENABLED,
+            )
+            
+            if archive_row is not None:
+                archive_rows.append(archive_row)
+            if base_row:
+                base_rows.append(base_row)
+            else:
+                parse_errors += 1
         
-        archive_rows.append(archive_row)
-        if base_row:
-            base_rows.append(base_row)
-        else:
-            parse_errors += 1
+        if ledger_check is not None and not already_processed:
+            already_processed = ledger_check.result()
     
-    logger.info(f"Parsed {len(base_rows)} valid rows, {parse_errors} parse errors")
+    if already_processed:
+        logger.info("File already processed: %s", gcs_uri)
+        return
+    
+    log_fields = {**log_fields, "rows": len(base_rows), "parse_errors": parse_errors}
+    logger.info(
+        "Parsed %d valid rows, %d parse errors", len(base_rows), parse_errors,
+        extra={"json_fields": log_fields},
+    )
     
     # Load to BigQuery
     try:
@@ -448,24 +800,34 @@ def process_ftplog(cloud_event):
             base_rows,
             archive_rows,
             gcs_uri,
-            originating_filename
+            originating_filename,
+            rows_expected=rows_expected,
         )
-        logger.info(f"Successfully processed {gcs_uri} - Status: {status}, Rows: {len(base_rows)}")
+        logger.info(
+            "Successfully processed %s - Status: %s, Rows: %d",
+            gcs_uri, status, len(base_rows),
+            extra={"json_fields": {**log_fields, "status": status}},
+        )
+        if PROCESSED_MARKER_ENABLED:
+            mark_processed(blob, datetime.now(timezone.utc).isoformat())
     except Exception as e:
-        logger.error(f"Failed to load {gcs_uri}: {e}")
+        logger.error(
+            "Failed to load %s: %s", gcs_uri, e,
+            extra={"json_fields": {**log_fields, "status": "FAILED"}},
+        )
         # Record failure
         try:
             failed_row = [{
                 "gcs_uri": gcs_uri,
                 "originating_filename": originating_filename,
-                "processed_timestamp": datetime.utcnow().isoformat(),
+                "processed_timestamp": datetime.now(timezone.utc).isoformat(),
                 "rows_loaded": 0,
                 "status": "FAILED",
                 "error_message": str(e)[:1000],
             }]
             bq_client.insert_rows_json(FQ_PROCESSED_TABLE, failed_row)
         except Exception as record_error:
-            logger.error(f"Failed to record failure: {record_error}")
+            logger.error("Failed to record failure: %s", record_error)
         raise
 
 
@@ -479,20 +841,19 @@ def run_scheduled_etl(request):
     HTTP-triggered function to run the multi-statement ETL script.
     Intended to be called by Cloud Scheduler every 5 minutes.
     """
-    if not SCHEDULED_SQL_PATH.exists():
-        logger.error(f"Missing SQL file: {SCHEDULED_SQL_PATH}")
+    if SCHEDULED_SQL is None:
+        logger.error("Missing SQL file: %s", SCHEDULED_SQL_PATH)
         return ("Missing SQL file", 500)
 
-    sql = SCHEDULED_SQL_PATH.read_text()
-    bq_client = bigquery.Client(project=PROJECT_ID)
+    bq_client = get_bq_client()
 
     try:
-        job = bq_client.query(sql)
+        job = bq_client.query(SCHEDULED_SQL)
         job.result()
-        logger.info(f"Scheduled ETL completed. Job ID: {job.job_id}")
+        logger.info("Scheduled ETL completed. Job ID: %s", job.job_id)
         return ({"status": "SUCCESS", "job_id": job.job_id}, 200)
     except Exception as exc:
-        logger.error(f"Scheduled ETL failed: {exc}")
+        logger.error("Scheduled ETL failed: %s", exc)
         return ({"status": "FAILED", "error": str(exc)}, 500)
 
 
@@ -506,31 +867,42 @@ def run_monitoring_alert(request):
     HTTP-triggered function to read the latest pipeline_monitoring snapshot
     and emit a log entry if status='ALERT'. Intended for Cloud Scheduler.
     """
-    bq_client = bigquery.Client(project=PROJECT_ID)
+    bq_client = get_bq_client()
+    # Snapshots are written every few minutes, so the latest one is always
+    # inside the lookback window; the predicate prunes older partitions
     query = f"""
         SELECT status, details
         FROM `{PROJECT_ID}.{DATASET_ID}.pipeline_monitoring`
+        WHERE check_time >= TIMESTAMP_SUB(
+            CURRENT_TIMESTAMP(), INTERVAL {MONITORING_LOOKBACK_HOURS} HOUR
+        )
         ORDER BY check_time DESC
         LIMIT 1
     """
+    job_config = bigquery.QueryJobConfig(
+        maximum_bytes_billed=MONITORING_MAX_BYTES_BILLED
+    )
 
     try:
-        rows = list(bq_client.query(query).result())
+        rows = list(bq_client.query(query, job_config=job_config).result())
         if not rows:
-            logger.warning("PIPELINE_ALERT no monitoring rows found")
+            logger.warning(
+                "PIPELINE_ALERT no monitoring rows found in the last %dh",
+                MONITORING_LOOKBACK_HOURS,
+            )
             return ({"status": "NO_ROWS"}, 200)
 
         status = rows[0].get("status")
         details = rows[0].get("details")
 
         if status == "ALERT":
-            logger.error(f"PIPELINE_ALERT status=ALERT details={details}")
+            logger.error("PIPELINE_ALERT status=ALERT details=%s", details)
             return ({"status": "ALERT", "details": details}, 200)
 
-        logger.info(f"PIPELINE_ALERT status=OK details={details}")
+        logger.info("PIPELINE_ALERT status=OK details=%s", details)
         return ({"status": "OK", "details": details}, 200)
     except Exception as exc:
-        logger.error(f"PIPELINE_ALERT monitoring check failed: {exc}")
+        logger.error("PIPELINE_ALERT monitoring check failed: %s", exc)
         return ({"status": "FAILED", "error": str(exc)}, 500)
 
 
@@ -554,7 +926,7 @@ def test_locally(bucket: str, file_name: str):
         "name": file_name,
     }
     
-    logger.info(f"Testing locally with bucket={bucket}, file={file_name}")
+    logger.info("Testing locally with bucket=%s, file=%s", bucket, file_name)
     process_ftplog(mock_event)
 
 
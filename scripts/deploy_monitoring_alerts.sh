@@ -99,9 +99,12 @@ fi
 
 # Create logs-based metric
 log_info "Creating logs-based metric ${MONITORING_ALERT_METRIC_NAME}..."
-FILTER="resource.type=\"cloud_run_revision\" AND resource.labels.service_name=\"${MONITORING_ALERT_FUNCTION_NAME}\" AND textPayload:\"PIPELINE_ALERT\""
+FILTER="resource.type=\"cloud_run_revision\" AND resource.labels.service_name=\"${MONITORING_ALERT_FUNCTION_NAME}\" AND (textPayload:\"PIPELINE_ALERT\" OR jsonPayload.message:\"PIPELINE_ALERT\")"
 if gcloud logging metrics describe "${MONITORING_ALERT_METRIC_NAME}" --project "${PROJECT_ID}" &>/dev/null; then
-  log_info "Metric already exists: ${MONITORING_ALERT_METRIC_NAME}"
+  log_info "Metric already exists, updating filter: ${MONITORING_ALERT_METRIC_NAME}"
+  gcloud logging metrics update "${MONITORING_ALERT_METRIC_NAME}" \
+    --project "${PROJECT_ID}" \
+    --log-filter "${FILTER}"
 else
   gcloud logging metrics create "${MONITORING_ALERT_METRIC_NAME}" \
     --project "${PROJECT_ID}" \
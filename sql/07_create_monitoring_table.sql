@@ -26,6 +26,7 @@ CREATE TABLE IF NOT EXISTS `__PROJECT_ID__.__DATASET_ID__.pipeline_monitoring`
     details STRING
         OPTIONS(description = 'Freeform alert details')
 )
+PARTITION BY DATE(check_time)
 OPTIONS (
     description = 'Point-in-time pipeline health snapshots for alerting'
 );
@@ -46,6 +46,11 @@ WHERE gcs_uri = file_to_reprocess;
 -- SCENARIO 2: Reprocess All Failed Files
 -- =============================================================================
 -- Use this to retry all files that previously failed
+--
+-- Note: the Cloud Function loads base_ftplog and archive_ftplog in parallel
+-- and cancels the other load when one fails. If the other load had already
+-- finished, a FAILED file can still have rows in one of the two tables;
+-- check both before reprocessing so the retry does not duplicate them.
 
 -- Step 1: Identify failed files
 SELECT 
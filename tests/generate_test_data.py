@@ -18,15 +18,27 @@ Usage:
 """
 
 import argparse
+import gzip
 import json
 import os
 import random
 import uuid
 from datetime import datetime, timedelta
+from concurrent.futures import ProcessPoolExecutor
 from typing import Dict, List, Optional
 import hashlib
 from datetime import timezone
 
+try:
+    import orjson
+except ImportError:  # orjson is optional; fall back to the stdlib encoder
+    orjson = None
+
+try:
+    from isal import igzip as gzip_module  # ISA-L gzip, several times faster
+except ImportError:  # isal is optional; fall back to the stdlib gzip
+    gzip_module = gzip
+
 
 # =============================================================================
 # Configuration
@@ -74,6 +86,26 @@ STATUS_RESPONSES = {
     550: "Requested action not taken. File unavailable.",
 }
 
+# Status code logged when an action succeeds (actions not listed log 200).
+# Logout logs 226 rather than 221, which has no entry in STATUS_RESPONSES.
+ACTION_SUCCESS_CODES = {
+    "Login": 230,
+    "Logout": 226,
+    "Store": 226,
+    "Retrieve": 226,
+    "Delete": 250,
+    "Rename": 250,
+    "MakeDir": 250,
+    "RemoveDir": 250,
+}
+
+# Status codes used for failed operations
+FAILURE_STATUS_CODES = [421, 425, 426, 450, 530, 550]
+
+# Actions that name a file, and the subset that transfers bytes
+FILE_ACTIONS = frozenset({"Store", "Retrieve", "Delete", "Rename"})
+TRANSFER_ACTIONS = frozenset({"Store", "Retrieve"})
+
 # Sample customer IDs (numeric usernames)
 SAMPLE_CUST_IDS = [12345, 67890, 11111, 22222, 33333, 44444, 55555]
 
@@ -98,122 +130,153 @@ IP_PREFIXES = ["192.168.1.", "10.0.0.", "172.16.0.", "203.0.113."]
 # Data Generation Functions
 # =============================================================================
 
-def generate_ip_address() -> str:
-    """Generate a random IP address."""
-    prefix = random.choice(IP_PREFIXES)
-    return f"{prefix}{random.randint(1, 254)}"
+def compute_hash_code(data: str) -> int:
+    """Compute a deterministic signed 64-bit hash code."""
+    # blake2b emits exactly 8 bytes here, so there is no digest slicing or
+    # manual two's-complement fixup on the per-row path
+    digest = hashlib.blake2b(data.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, byteorder="big", signed=True)
 
 
-def generate_session_id() -> str:
-    """Generate a random session ID."""
-    return f"sess-{uuid.uuid4().hex[:12]}"
+def raw_timestamp_text(event_dt_text: str) -> str:
+    """Derive the RawData timestamp ('YYYY-MM-DD HH:MM:SS') from EventDt text.
 
+    Slicing the already formatted ISO string avoids a second strftime call,
+    which parses its format string in Python on every call.
+    """
+    return f"{event_dt_text[:10]} {event_dt_text[11:19]}"
 
-def compute_hash_code(data: str) -> int:
-    """Compute a deterministic signed 64-bit hash code."""
-    digest = hashlib.sha256(data.encode("utf-8")).digest()
-    value = int.from_bytes(digest[:8], byteorder="big", signed=False)
-    if value >= 2**63:
-        value -= 2**64
-    return value
 
+def serialize_event(event: Dict) -> bytes:
+    """Serialize an event as compact UTF-8 JSON (orjson when available)."""
+    if orjson is not None:
+        return orjson.dumps(event)
+    return json.dumps(event, separators=(',', ':')).encode('utf-8')
 
-def generate_ftp_event(
-    event_dt: datetime,
+
+def generate_ftp_events(
+    base_timestamp: datetime,
     source: str,
-    is_customer: bool = True
-) -> Dict:
-    """Generate a single FTP log event."""
-    
-    # Determine user type
-    if is_customer:
-        cust_id = random.choice(SAMPLE_CUST_IDS)
-        user_name = str(cust_id)
-        partner_name = None
-    else:
-        cust_id = 0
-        partner_name = random.choice(SAMPLE_PARTNERS)
-        user_name = partner_name
-    
-    # Choose action and appropriate status
-    action = random.choice(FTP_ACTIONS)
+    num_events: int,
+    rng: Optional[random.Random] = None
+) -> List[Dict]:
+    """
+    Generate a batch of FTP log events spread over a 5-minute window.
     
-    # Weight status codes based on action (most operations succeed)
-    if random.random() < 0.9:  # 90% success
-        if action == "Login":
-            status_code = 230
-        elif action == "Logout":
-            status_code = 221 if 221 in STATUS_RESPONSES else 226
-        elif action in ["Store", "Retrieve"]:
-            status_code = 226
-        elif action in ["Delete", "Rename", "MakeDir", "RemoveDir"]:
-            status_code = 250
-        else:
-            status_code = 200
-    else:  # 10% failures
-        status_code = random.choice([421, 425, 426, 450, 530, 550])
+    Each random field is drawn for the whole batch up front
+    (random.choices with k=num_events) and the columns are only zipped into
+    event dicts at the end, instead of ~10 individual random calls per row.
     
-    server_response = STATUS_RESPONSES.get(status_code, "Unknown status")
+    Draws come from ``rng`` when given, otherwise from the module-level
+    generator.
+    """
+    if rng is None:
+        rng = random
+    n = num_events
+    rand = rng.random
+    choices = rng.choices
     
-    # Generate filename
-    if action in ["Store", "Retrieve", "Delete", "Rename"]:
-        path_template = random.choice(SAMPLE_PATHS)
-        filename = path_template.format(random.randint(1000, 9999))
-        bytes_transferred = random.randint(1024, 10_000_000) if action in ["Store", "Retrieve"] else 0
-    else:
-        filename = "-"
-        bytes_transferred = 0
+    # Column draws
+    offsets = choices(range(301), k=n)
+    is_customer = [rand() < 0.7 for _ in range(n)]  # 70% customers, 30% partners
+    cust_ids = choices(SAMPLE_CUST_IDS, k=n)
+    partners = choices(SAMPLE_PARTNERS, k=n)
+    actions = choices(FTP_ACTIONS, k=n)
+    succeeded = [rand() < 0.9 for _ in range(n)]  # 90% success
+    failure_codes = choices(FAILURE_STATUS_CODES, k=n)
+    path_templates = choices(SAMPLE_PATHS, k=n)
+    path_numbers = choices(range(1000, 10000), k=n)
+    transfer_sizes = choices(range(1024, 10_000_001), k=n)
+    raw_ip_prefixes = choices(IP_PREFIXES, k=n)
+    raw_ip_hosts = choices(range(1, 255), k=n)
+    ip_prefixes = choices(IP_PREFIXES, k=n)
+    ip_hosts = choices(range(1, 255), k=n)
+    # 48 random bits as 12 hex digits, drawn from rng rather than one uuid4()
+    # (an os.urandom read) per row, so seeded runs reproduce them
+    getrandbits = rng.getrandbits
+    session_ids = [f"sess-{getrandbits(48):012x}" for _ in range(n)]
     
     # Normalize to UTC for consistent EventDt
-    if event_dt.tzinfo is None:
-        event_dt_utc = event_dt.replace(tzinfo=timezone.utc)
+    if base_timestamp.tzinfo is None:
+        base_utc = base_timestamp.replace(tzinfo=timezone.utc)
     else:
-        event_dt_utc = event_dt.astimezone(timezone.utc)
-
-    event_dt_text = event_dt_utc.isoformat(timespec="milliseconds").replace("+00:00", "Z")
-
-    # Generate raw data line
-    raw_data = (
-        f"{event_dt_utc.strftime('%Y-%m-%d %H:%M:%S')} "
-        f"{generate_ip_address()} "
-        f"{user_name} "
-        f"{action.upper()} "
-        f"{filename} "
-        f"{status_code} "
-        f"{bytes_transferred}"
-    )
+        base_utc = base_timestamp.astimezone(timezone.utc)
     
-    event = {
-        "UserName": user_name,
-        "CustId": cust_id,
-        "PartnerName": partner_name,
-        "EventDt": event_dt_text,
-        "Action": action,
-        "Filename": filename,
-        "SessionId": generate_session_id(),
-        "IpAddress": generate_ip_address(),
-        "Source": source,
-        "Bytes": bytes_transferred,
-        "StatusCode": status_code,
-        "ServerResponse": server_response,
-        "RawData": raw_data,
-        "HashCode": compute_hash_code(raw_data),
-    }
+    # Offsets only take 301 distinct values, so format each timestamp once
+    time_texts: Dict[int, tuple[str, str]] = {}
     
-    return event
+    events = []
+    for i in range(n):
+        offset = offsets[i]
+        texts = time_texts.get(offset)
+        if texts is None:
+            event_dt_utc = base_utc + timedelta(seconds=offset)
+            iso_text = event_dt_utc.isoformat(timespec="milliseconds").replace("+00:00", "Z")
+            texts = (iso_text, raw_timestamp_text(iso_text))
+            time_texts[offset] = texts
+        event_dt_text, raw_dt_text = texts
+        
+        if is_customer[i]:
+            cust_id = cust_ids[i]
+            user_name = str(cust_id)
+            partner_name = None
+        else:
+            cust_id = 0
+            partner_name = partners[i]
+            user_name = partner_name
+        
+        action = actions[i]
+        status_code = ACTION_SUCCESS_CODES.get(action, 200) if succeeded[i] else failure_codes[i]
+        
+        if action in FILE_ACTIONS:
+            filename = path_templates[i].format(path_numbers[i])
+            bytes_transferred = transfer_sizes[i] if action in TRANSFER_ACTIONS else 0
+        else:
+            filename = "-"
+            bytes_transferred = 0
+        
+        raw_data = (
+            f"{raw_dt_text} "
+            f"{raw_ip_prefixes[i]}{raw_ip_hosts[i]} "
+            f"{user_name} "
+            f"{action.upper()} "
+            f"{filename} "
+            f"{status_code} "
+            f"{bytes_transferred}"
+        )
+        
+        events.append({
+            "UserName": user_name,
+            "CustId": cust_id,
+            "PartnerName": partner_name,
+            "EventDt": event_dt_text,
+            "Action": action,
+            "Filename": filename,
+            "SessionId": session_ids[i],
+            "IpAddress": f"{ip_prefixes[i]}{ip_hosts[i]}",
+            "Source": source,
+            "Bytes": bytes_transferred,
+            "StatusCode": status_code,
+            "ServerResponse": STATUS_RESPONSES.get(status_code, "Unknown status"),
+            "RawData": raw_data,
+            "HashCode": compute_hash_code(raw_data),
+        })
+    
+    return events
 
 
 def generate_ftplog_file(
     base_timestamp: datetime,
     source: str,
     num_events: int,
-    include_malformed: bool = False
-) -> tuple[str, List[str]]:
+    include_malformed: bool = False,
+    rng: Optional[random.Random] = None
+) -> tuple[str, List[bytes]]:
     """
     Generate a complete NDJSON file with FTP log events.
     
     Returns:
-        Tuple of (filename, list of JSON lines)
+        Tuple of (filename, list of UTF-8 encoded JSON lines)
     """
     # Generate filename matching the .NET pattern
     # {Source}-{EventDt:yyyyMMdd-HHmmss}{Now:ffff}-{Guid}
@@ -222,53 +285,100 @@ def generate_ftplog_file(
     guid = str(uuid.uuid4())
     filename = f"{source}-{timestamp_str}{microseconds}-{guid}.json"
     
-    lines = []
-    
-    # Generate events spread across a time window
-    for i in range(num_events):
-        # Spread events across 5-minute window
-        event_offset = timedelta(seconds=random.randint(0, 300))
-        event_dt = base_timestamp + event_offset
-        
-        # Mix of customers (70%) and partners (30%)
-        is_customer = random.random() < 0.7
-        
-        event = generate_ftp_event(event_dt, source, is_customer)
-        lines.append(json.dumps(event, separators=(',', ':')))
+    # Generate events spread across a 5-minute window
+    if rng is None:
+        rng = random
+    events = generate_ftp_events(base_timestamp, source, num_events, rng)
+    lines = [serialize_event(event) for event in events]
     
     # Optionally include malformed JSON for testing error handling
     if include_malformed:
         malformed_lines = [
-            '{"incomplete": "json',  # Missing closing brace
-            'not json at all',       # Plain text
-            '',                      # Empty line
-            '   ',                   # Whitespace only
+            b'{"incomplete": "json',  # Missing closing brace
+            b'not json at all',       # Plain text
+            b'',                      # Empty line
+            b'   ',                   # Whitespace only
         ]
         # Insert malformed lines at random positions
         for malformed in malformed_lines:
-            if random.random() < 0.5:  # 50% chance to include each
-                pos = random.randint(0, len(lines))
+            if rng.random() < 0.5:  # 50% chance to include each
+                pos = rng.randint(0, len(lines))
                 lines.insert(pos, malformed)
     
     return filename, lines
 
 
+def _generate_one(task: tuple) -> tuple[str, str, int]:
+    """
+    Generate and write a single test file (process-pool worker).
+
+    Args:
+        task: Tuple of (output_dir, index, file_timestamp, rows_per_file,
+              include_malformed, seed, compress)
+
+    Returns:
+        Tuple of (filepath, filename, number of lines written)
+    """
+    output_dir, i, file_timestamp, rows_per_file, include_malformed, seed, compress = task
+
+    # A generator per file keeps output reproducible regardless of how files
+    # are scheduled across workers, and forked workers never share a stream
+    rng = random.Random(f"{seed}-{i}") if seed is not None else random.Random()
+
+    source = rng.choice(FTP_SERVERS)
+
+    # Vary the number of rows slightly
+    actual_rows = rows_per_file + rng.randint(-rows_per_file // 10, rows_per_file // 10)
+    actual_rows = max(1, actual_rows)
+
+    filename, lines = generate_ftplog_file(
+        base_timestamp=file_timestamp,
+        source=source,
+        num_events=actual_rows,
+        include_malformed=include_malformed,
+        rng=rng
+    )
+
+    if compress:
+        filename += '.gz'
+    filepath = os.path.join(output_dir, filename)
+    # One joined write per file: GzipFile runs the compressor on every
+    # write() call, so per-line writes cost far more than the extra copy
+    with open(filepath, 'wb', buffering=1 << 20) as raw:
+        # Level 1 keeps compression cheap; NDJSON still shrinks several-fold
+        f = gzip_module.GzipFile(fileobj=raw, mode='wb', compresslevel=1) if compress else raw
+        with f:
+            f.write(b'\n'.join(lines))
+            f.write(b'\n')
+
+    return filepath, filename, len(lines)
+
+
 def generate_test_files(
     output_dir: str,
     num_files: int,
     rows_per_file: int,
     start_date: Optional[datetime] = None,
-    include_malformed: bool = False
+    include_malformed: bool = False,
+    seed: Optional[int] = None,
+    workers: Optional[int] = None,
+    compress: bool = False
 ) -> List[str]:
     """
     Generate multiple test NDJSON files.
     
+    Files are independent CPU-bound work, so they are spread across a
+    process pool (threads would serialize on the GIL).
+    
     Args:
         output_dir: Directory to write files to
         num_files: Number of files to generate
         rows_per_file: Approximate number of events per file
         start_date: Starting timestamp (defaults to now)
         include_malformed: Whether to include malformed JSON lines
+        seed: Random seed for reproducible output
+        workers: Number of worker processes (defaults to CPU count)
+        compress: Write gzip-compressed .json.gz files
         
     Returns:
         List of generated file paths
@@ -280,30 +390,32 @@ def generate_test_files(
     elif start_date.tzinfo is None:
         start_date = start_date.replace(tzinfo=timezone.utc)
     
-    generated_files = []
-    
-    for i in range(num_files):
-        # Each file represents a 5-minute batch, offset by file index
-        file_timestamp = start_date - timedelta(minutes=5 * i)
-        source = random.choice(FTP_SERVERS)
-        
-        # Vary the number of rows slightly
-        actual_rows = rows_per_file + random.randint(-rows_per_file // 10, rows_per_file // 10)
-        actual_rows = max(1, actual_rows)
-        
-        filename, lines = generate_ftplog_file(
-            base_timestamp=file_timestamp,
-            source=source,
-            num_events=actual_rows,
-            include_malformed=include_malformed and (i == num_files - 1)  # Only last file has malformed
+    # Each file represents a 5-minute batch, offset by file index.
+    # Only the last file has malformed lines.
+    tasks = [
+        (
+            output_dir,
+            i,
+            start_date - timedelta(minutes=5 * i),
+            rows_per_file,
+            include_malformed and (i == num_files - 1),
+            seed,
+            compress,
         )
-        
-        filepath = os.path.join(output_dir, filename)
-        with open(filepath, 'w', encoding='utf-8') as f:
-            f.write('\n'.join(lines))
-        
+        for i in range(num_files)
+    ]
+    
+    max_workers = max(1, min(num_files, workers or os.cpu_count() or 1))
+    if max_workers == 1:
+        generated = [_generate_one(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            generated = list(executor.map(_generate_one, tasks))
+    
+    generated_files = []
+    for filepath, filename, line_count in generated:
         generated_files.append(filepath)
-        print(f"Generated: {filename} ({len(lines)} lines)")
+        print(f"Generated: {filename} ({line_count} lines)")
     
     return generated_files
 
@@ -327,6 +439,9 @@ Examples:
   # Generate files with specific start date
   python generate_test_data.py --output-dir ./test_files --num-files 5 --start-date "2026-01-28T10:00:00"
   
+  # Generate gzip-compressed .json.gz files (loaded by the Cloud Function only)
+  python generate_test_data.py --output-dir ./test_files --num-files 3 --gzip
+  
 After generating, upload to GCS:
   gsutil cp ./test_files/*.json gs://${GCS_BUCKET}/logs/
         """
@@ -366,12 +481,22 @@ After generating, upload to GCS:
         default=None,
         help='Random seed for reproducible output'
     )
+    parser.add_argument(
+        '--workers', '-w',
+        type=int,
+        default=None,
+        help='Number of worker processes (default: CPU count)'
+    )
+    parser.add_argument(
+        '--gzip', '-z',
+        action='store_true',
+        help='Write gzip-compressed .json.gz files (Cloud Function path only)'
+    )
     
     args = parser.parse_args()
     
-    # Set random seed if provided
+    # Seed is applied per file inside the workers
     if args.seed is not None:
-        random.seed(args.seed)
         print(f"Using random seed: {args.seed}")
     
     # Parse start date if provided
@@ -394,7 +519,10 @@ After generating, upload to GCS:
         num_files=args.num_files,
         rows_per_file=args.rows_per_file,
         start_date=start_date,
-        include_malformed=args.include_malformed
+        include_malformed=args.include_malformed,
+        seed=args.seed,
+        workers=args.workers,
+        compress=args.gzip
     )
     
     print(f"\n{'='*60}")
@@ -402,9 +530,11 @@ After generating, upload to GCS:
     print(f"{'='*60}")
     print("\nNext steps:")
     print(f"  1. Review files: ls -la {args.output_dir}")
-    print(f"  2. View sample: head -5 {generated_files[0] if generated_files else '<file>'}")
+    viewer = "zcat" if args.gzip else "cat"
+    extension = "json.gz" if args.gzip else "json"
+    print(f"  2. View sample: {viewer} {generated_files[0] if generated_files else '<file>'} | head -5")
     print(f"  3. Upload to GCS:")
-    print(f"     gsutil cp {args.output_dir}/*.json gs://$GCS_BUCKET/logs/")
+    print(f"     gsutil cp {args.output_dir}/*.{extension} gs://$GCS_BUCKET/logs/")
     print()
 
 
@@ -0,0 +1,105 @@
+import gzip
+import importlib.util
+import io
+import os
+
+import pytest
+
+pytest.importorskip("functions_framework")
+pytest.importorskip("google.cloud.bigquery")
+pytest.importorskip("google.cloud.storage")
+
+MAIN_PATH = os.path.join(os.path.dirname(__file__), '..', 'cloud_function', 'main.py')
+_spec = importlib.util.spec_from_file_location("cloud_function_main", MAIN_PATH)
+main = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(main)
+
+
+class FakeLoadJob:
+    def __init__(self, table, error=None):
+        self.table = table
+        self.job_id = f"job-{table}"
+        self.errors = [{"message": str(error)}] if error else None
+        self.error = error
+        self.cancelled = False
+
+    def result(self):
+        if self.error:
+            raise self.error
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class FakeBigQueryClient:
+    """Starts a FakeLoadJob per load; tables in ``fail_start`` raise instead."""
+
+    def __init__(self, fail_start=(), fail_result=()):
+        self.fail_start = fail_start
+        self.fail_result = fail_result
+        self.jobs = {}
+
+    def load_table_from_file(self, buf, table, job_config=None):
+        if table in self.fail_start:
+            raise RuntimeError(f"upload to {table} failed")
+        error = RuntimeError(f"load into {table} failed") if table in self.fail_result else None
+        self.jobs[table] = FakeLoadJob(table, error)
+        return self.jobs[table]
+
+
+def _load(client):
+    return main.load_to_bigquery(
+        client, [{"id": 1}], [{"raw": "{}"}],
+        "gs://bucket/logs/file.json", "file.json",
+    )
+
+
+def test_load_cancels_archive_when_base_start_fails():
+    client = FakeBigQueryClient(fail_start=(main.FQ_BASE_TABLE,))
+    with pytest.raises(Exception, match="base table"):
+        _load(client)
+    assert client.jobs[main.FQ_ARCHIVE_TABLE].cancelled
+
+
+def test_load_cancels_archive_when_base_job_fails():
+    client = FakeBigQueryClient(fail_result=(main.FQ_BASE_TABLE,))
+    with pytest.raises(Exception, match="base table"):
+        _load(client)
+    assert client.jobs[main.FQ_ARCHIVE_TABLE].cancelled
+    assert not client.jobs[main.FQ_BASE_TABLE].cancelled
+
+
+class FakeBlob:
+    """In-memory stand-in for ``storage.Blob`` as used by iter_blob_lines."""
+
+    def __init__(self, name, data, content_encoding=None):
+        self.name = name
+        self.data = data
+        self.content_encoding = content_encoding
+        self.open_kwargs = None
+
+    def open(self, mode, chunk_size=None, **kwargs):
+        self.open_kwargs = kwargs
+        return io.BytesIO(self.data)
+
+
+NDJSON = b'{"a":1}\r\n{"b":2}\n\n{"c":3}'
+
+
+def test_iter_blob_lines_splits_across_chunk_boundaries():
+    blob = FakeBlob("logs/file.json", NDJSON)
+    # A 4-byte chunk splits both records and the \r\n terminator
+    lines = list(main.iter_blob_lines(blob, chunk_size=4))
+    assert lines == [b'{"a":1}', b'{"b":2}', b'', b'{"c":3}']
+    assert blob.open_kwargs == {"raw_download": True}
+
+
+@pytest.mark.parametrize("name, content_encoding", [
+    ("logs/file.json.gz", None),
+    ("logs/file.json", "gzip"),
+    ("logs/file.json.gz", "gzip"),
+])
+def test_iter_blob_lines_decompresses_gzip(name, content_encoding):
+    blob = FakeBlob(name, gzip.compress(NDJSON), content_encoding)
+    lines = list(main.iter_blob_lines(blob, chunk_size=5))
+    assert lines == [b'{"a":1}', b'{"b":2}', b'', b'{"c":3}']
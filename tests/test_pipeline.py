@@ -19,19 +19,40 @@ import argparse
 import json
 import os
 import sys
-import subprocess
 import tempfile
+import threading
 import time
 import uuid
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
-from typing import Optional, List, Dict, Tuple
+from functools import lru_cache
+from typing import Any, Callable, Optional, List, Dict, Tuple
 import hashlib
 
+try:
+    import orjson
+    _json_dumps = orjson.dumps
+except ImportError:  # orjson is optional; fall back to the stdlib encoder
+    orjson = None
+
+    def _json_dumps(obj: Any) -> bytes:
+        return json.dumps(obj).encode("utf-8")
+
+try:
+    from google.cloud import bigquery
+    from google.cloud import storage
+except ImportError:  # only needed to run the suite, not to import it
+    bigquery = None
+    storage = None
+
 # Test configuration (use environment variables, no hardcoded sandbox values)
 DEFAULT_PROJECT = os.environ.get("PROJECT_ID", "your-gcp-project-id")
 DEFAULT_BUCKET = os.environ.get("GCS_BUCKET", f"{DEFAULT_PROJECT}-ftplog")
 DEFAULT_DATASET = os.environ.get("DATASET_ID", "logviewer")
 
+# ETL script run by the processing and idempotency tests
+ETL_SQL_PATH = os.path.join(os.path.dirname(__file__), '..', 'sql', '06_scheduled_query_etl.sql')
+
 
 class Colors:
     """ANSI color codes for terminal output."""
@@ -43,47 +64,114 @@ class Colors:
     BOLD = '\033[1m'
 
 
+# Tests that run concurrently collect their log lines per thread, so each
+# test's output can be printed as one block once it finishes
+_log_capture = threading.local()
+
+
+def _emit(line: str):
+    lines = getattr(_log_capture, "lines", None)
+    if lines is None:
+        print(line)
+    else:
+        lines.append(line)
+
+
 def log_info(msg: str):
-    print(f"{Colors.BLUE}[INFO]{Colors.RESET} {msg}")
+    _emit(f"{Colors.BLUE}[INFO]{Colors.RESET} {msg}")
 
 
 def log_success(msg: str):
-    print(f"{Colors.GREEN}[PASS]{Colors.RESET} {msg}")
+    _emit(f"{Colors.GREEN}[PASS]{Colors.RESET} {msg}")
 
 
 def log_error(msg: str):
-    print(f"{Colors.RED}[FAIL]{Colors.RESET} {msg}")
+    _emit(f"{Colors.RED}[FAIL]{Colors.RESET} {msg}")
 
 
 def log_warning(msg: str):
-    print(f"{Colors.YELLOW}[WARN]{Colors.RESET} {msg}")
-
-
-def run_command(cmd: str, capture: bool = True) -> Tuple[int, str, str]:
-    """Run a shell command and return exit code, stdout, stderr."""
-    result = subprocess.run(
-        cmd,
-        shell=True,
-        capture_output=capture,
-        text=True
-    )
-    return result.returncode, result.stdout, result.stderr
+    _emit(f"{Colors.YELLOW}[WARN]{Colors.RESET} {msg}")
 
 
 def compute_hash_code(canonical: str) -> int:
     """Compute deterministic signed 64-bit hash_code from canonical string."""
-    digest = hashlib.sha256(canonical.encode("utf-8")).digest()
-    value = int.from_bytes(digest[:8], byteorder="big", signed=False)
-    if value >= 2**63:
-        value -= 2**64
-    return value
+    # Same scheme as generate_test_data.compute_hash_code
+    digest = hashlib.blake2b(canonical.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, byteorder="big", signed=True)
+
 
+def run_bq_query(query: str, client: "bigquery.Client") -> Tuple[bool, Any]:
+    """Run a BigQuery query and return success status and rows (or error).
+
+    Uses ``query_and_wait`` on a shared client, which returns small results
+    from a single ``jobs.query`` call instead of forking the ``bq`` CLI.
+    On success the rows are returned as a list of dicts; on failure the
+    error message is returned instead.
+    """
+    try:
+        rows = client.query_and_wait(query)
+        return True, [dict(row.items()) for row in rows]
+    except Exception as e:
+        return False, str(e)
 
-def run_bq_query(query: str, project: str) -> Tuple[bool, str]:
-    """Run a BigQuery query and return success status and output."""
-    cmd = f'bq query --use_legacy_sql=false --project_id={project} --format=json "{query}"'
-    code, stdout, stderr = run_command(cmd)
-    return code == 0, stdout if code == 0 else stderr
+
+def event_date_filter(min_date: Any, max_date: Any) -> str:
+    """Return an ``AND`` predicate pruning base_ftplog to an event date range.
+
+    base_ftplog is partitioned by ``DATE(event_dt)``, so bounding the date
+    lets BigQuery scan only the matching partitions. Rows with a NULL
+    event_dt (unparseable EventDt) are kept; they live in the NULL partition,
+    which is scanned as well. Returns an empty string when the range is
+    unknown.
+    """
+    if min_date is None or max_date is None:
+        return ""
+    return (
+        f" AND (DATE(event_dt) BETWEEN DATE('{min_date}') AND DATE('{max_date}')"
+        f" OR event_dt IS NULL)"
+    )
+
+
+def wait_for_rows(
+    query: str,
+    client: "bigquery.Client",
+    until: Callable[[List[Dict]], bool] = bool,
+    timeout: float = 10.0,
+    initial: float = 0.25,
+    max_interval: float = 2.0
+) -> Tuple[bool, Any]:
+    """Poll a query with exponential backoff until ``until(rows)`` holds.
+
+    Returns as soon as the condition is met (or the query fails), so the
+    caller waits only as long as the pipeline takes to converge. After
+    ``timeout`` seconds the last result is returned as-is.
+    """
+    deadline = time.monotonic() + timeout
+    interval = initial
+    while True:
+        success, output = run_bq_query(query, client)
+        if not success or until(output) or time.monotonic() + interval > deadline:
+            return success, output
+        time.sleep(interval)
+        interval = min(interval * 2, max_interval)
+
+
+@lru_cache(maxsize=None)
+def load_etl_sql(project: str, dataset: str) -> str:
+    """Read the ETL script once and substitute the project/dataset tokens."""
+    with open(ETL_SQL_PATH) as f:
+        sql = f.read()
+    return sql.replace("__PROJECT_ID__", project).replace("__DATASET_ID__", dataset)
+
+
+def run_etl(client: "bigquery.Client", project: str, dataset: str) -> Tuple[bool, str]:
+    """Run the ETL script and return success status and job ID (or error)."""
+    try:
+        job = client.query(load_etl_sql(project, dataset))
+        job.result()
+        return True, job.job_id
+    except Exception as e:
+        return False, str(e)
 
 
 class PipelineTest:
@@ -95,10 +183,19 @@ class PipelineTest:
     instantiation to set per-run configuration.
     """
 
-    def configure(self, project: str, bucket: str, dataset: str):
+    def configure(
+        self,
+        project: str,
+        bucket: str,
+        dataset: str,
+        storage_client: Optional["storage.Client"] = None,
+        bq_client: Optional["bigquery.Client"] = None
+    ):
         self.project = project
         self.bucket = bucket
         self.dataset = dataset
+        self.storage_client = storage_client
+        self.bq_client = bq_client
         self.test_id = f"test-{uuid.uuid4().hex[:8]}"
         self.test_files: List[str] = []
 
@@ -108,9 +205,13 @@ class PipelineTest:
     
     def teardown(self):
         """Cleanup after test."""
-        # Remove test files from GCS
-        for file_path in self.test_files:
-            run_command(f'gsutil rm -f gs://{self.bucket}/logs/{file_path}')
+        # Remove test files through the shared Storage client. Objects that
+        # were never uploaded are skipped; any other failure raises and is
+        # reported by run_test.
+        self.storage_client.bucket(self.bucket).delete_blobs(
+            [f"logs/{file_path}" for file_path in self.test_files],
+            on_error=lambda blob: None,
+        )
     
     def run(self) -> bool:
         """Run the test. Returns True if passed."""
@@ -123,9 +224,12 @@ class TestGCSConnectivity(PipelineTest):
     def run(self) -> bool:
         log_info("Testing GCS bucket connectivity...")
         
-        code, stdout, _ = run_command(f'gsutil ls gs://{self.bucket}/')
-        if code != 0:
-            log_error(f"Cannot access bucket: gs://{self.bucket}")
+        # Ask for a single object rather than listing the whole bucket; this
+        # still exercises the objects.list permission the other tests need
+        try:
+            next(iter(self.storage_client.list_blobs(self.bucket, max_results=1)), None)
+        except Exception as e:
+            log_error(f"Cannot access bucket: gs://{self.bucket} ({e})")
             return False
         
         log_success("GCS bucket is accessible")
@@ -140,7 +244,7 @@ class TestBigQueryConnectivity(PipelineTest):
         
         success, output = run_bq_query(
             f"SELECT 1 as test FROM `{self.project}.{self.dataset}.processed_files` LIMIT 1",
-            self.project
+            self.bq_client
         )
         
         if not success:
@@ -159,7 +263,7 @@ class TestExternalTable(PipelineTest):
         
         success, output = run_bq_query(
             f"SELECT COUNT(*) as cnt FROM `{self.project}.{self.dataset}.external_ftplog_files` LIMIT 1",
-            self.project
+            self.bq_client
         )
         
         if not success:
@@ -180,44 +284,59 @@ class TestFileProcessing(PipelineTest):
         test_filename = f"FTP-TEST-{datetime.now().strftime('%Y%m%d-%H%M%S')}0001-{self.test_id}.json"
         self.test_files.append(test_filename)
         
-        # Create test data
+        # Create test data. Fields that are the same for every event live in
+        # one template (keys in the upload's column order); each event is a
+        # C-level copy with only the varying fields filled in.
+        template = {
+            "UserName": None,
+            "CustId": None,
+            "PartnerName": None,
+            "EventDt": None,
+            "Action": "Store",
+            "Filename": None,
+            "SessionId": None,
+            "IpAddress": None,
+            "Source": "FTP-TEST",
+            "Bytes": None,
+            "StatusCode": 226,
+            "ServerResponse": "Test successful",
+            "RawData": None,
+            "HashCode": None,
+        }
+        now = datetime.now(timezone.utc)
         test_events = []
         for i in range(5):
-            event_dt = (datetime.now(timezone.utc) - timedelta(minutes=i))
-            event_dt_text = event_dt.isoformat(timespec="milliseconds").replace("+00:00", "Z")
-            event = {
-                "UserName": f"{10000 + i}",
-                "CustId": 10000 + i,
-                "PartnerName": None,
-                "EventDt": event_dt_text,
-                "Action": "Store",
-                "Filename": f"/uploads/test_{i}.txt",
-                "SessionId": f"sess-{self.test_id}-{i}",
-                "IpAddress": f"192.168.1.{i}",
-                "Source": "FTP-TEST",
-                "Bytes": 1024 * (i + 1),
-                "StatusCode": 226,
-                "ServerResponse": "Test successful",
-                "RawData": f"test raw data {i}",
-                "HashCode": compute_hash_code(
-                    f"{event_dt_text}|FTP-TEST|/uploads/test_{i}.txt|{1024 * (i + 1)}|{10000 + i}"
-                ),
-            }
-            test_events.append(json.dumps(event))
+            event_dt_text = (now - timedelta(minutes=i)).isoformat(timespec="milliseconds").replace("+00:00", "Z")
+            cust_id = 10000 + i
+            filename = f"/uploads/test_{i}.txt"
+            size = 1024 * (i + 1)
+            event = template.copy()
+            event["UserName"] = str(cust_id)
+            event["CustId"] = cust_id
+            event["EventDt"] = event_dt_text
+            event["Filename"] = filename
+            event["SessionId"] = f"sess-{self.test_id}-{i}"
+            event["IpAddress"] = f"192.168.1.{i}"
+            event["Bytes"] = size
+            event["RawData"] = f"test raw data {i}"
+            event["HashCode"] = compute_hash_code(
+                f"{event_dt_text}|FTP-TEST|{filename}|{size}|{cust_id}"
+            )
+            test_events.append(event)
         
         # Write to temp file and upload
-        with tempfile.NamedTemporaryFile(mode='w', suffix='.json', delete=False) as f:
-            f.write('\n'.join(test_events))
+        with tempfile.NamedTemporaryFile(mode='wb', suffix='.json', delete=False) as f:
+            f.write(b'\n'.join(_json_dumps(event) for event in test_events))
             temp_path = f.name
         
         try:
-            # Upload to GCS
+            # Upload to GCS through the shared client (no gsutil process)
             log_info(f"Uploading test file: {test_filename}")
-            code, _, stderr = run_command(
-                f'gsutil cp {temp_path} gs://{self.bucket}/logs/{test_filename}'
-            )
-            if code != 0:
-                log_error(f"Failed to upload test file: {stderr}")
+            try:
+                blob = self.storage_client.bucket(self.bucket).blob(f"logs/{test_filename}")
+                blob.upload_from_filename(temp_path)
+            except Exception as e:
+                log_error(f"Failed to upload test file: {e}")
                 return False
             
             # Verify file is in external table
@@ -227,7 +346,7 @@ class TestFileProcessing(PipelineTest):
             success, output = run_bq_query(
                 f"SELECT COUNT(*) as cnt FROM `{self.project}.{self.dataset}.external_ftplog_files` "
                 f"WHERE _FILE_NAME = '{gcs_uri}'",
-                self.project
+                self.bq_client
             )
             
             if not success:
@@ -235,75 +354,55 @@ class TestFileProcessing(PipelineTest):
                 return False
             
             # Check if file is visible
-            try:
-                result = json.loads(output)
-                if result and result[0]['cnt'] == 0:
-                    log_warning("File not yet visible in external table (may need refresh)")
-            except:
-                pass
+            if output and output[0]['cnt'] == 0:
+                log_warning("File not yet visible in external table (may need refresh)")
             
             # Run ETL manually
             log_info("Running ETL...")
-            sql_path = os.path.join(
-                os.path.dirname(__file__), 
-                '..', 'sql', '06_scheduled_query_etl.sql'
-            )
-            
-            code, stdout, stderr = run_command(
-                f'bq query --use_legacy_sql=false --project_id={self.project} < {sql_path}'
-            )
+            success, output = run_etl(self.bq_client, self.project, self.dataset)
             
-            if code != 0:
-                log_error(f"ETL failed: {stderr}")
+            if not success:
+                log_error(f"ETL failed: {output}")
                 return False
             
             # Verify file was processed
             log_info("Verifying processing...")
-            time.sleep(2)  # Brief wait for consistency
-            
-            success, output = run_bq_query(
+            success, output = wait_for_rows(
                 f"SELECT rows_loaded, status FROM `{self.project}.{self.dataset}.processed_files` "
                 f"WHERE gcs_uri = '{gcs_uri}'",
-                self.project
+                self.bq_client
             )
             
             if not success:
                 log_error(f"Failed to check processed_files: {output}")
                 return False
             
-            try:
-                result = json.loads(output)
-                if not result:
-                    log_error("File was not recorded in processed_files")
-                    return False
-                
-                rows_loaded = result[0].get('rows_loaded', 0)
-                status = result[0].get('status', '')
-                
-                if status != 'SUCCESS':
-                    log_warning(f"Processing status: {status}")
-                
-                if rows_loaded != len(test_events):
-                    log_warning(f"Expected {len(test_events)} rows, got {rows_loaded}")
-                
-            except json.JSONDecodeError:
-                log_error(f"Failed to parse result: {output}")
+            if not output:
+                log_error("File was not recorded in processed_files")
                 return False
             
-            # Verify data in base table
-            success, output = run_bq_query(
+            rows_loaded = output[0].get('rows_loaded', 0)
+            status = output[0].get('status', '')
+            
+            if status != 'SUCCESS':
+                log_warning(f"Processing status: {status}")
+            
+            if rows_loaded != len(test_events):
+                log_warning(f"Expected {len(test_events)} rows, got {rows_loaded}")
+            
+            # Verify data in base table, pruned to the test events' dates
+            event_dates = sorted(event["EventDt"][:10] for event in test_events)
+            success, output = wait_for_rows(
                 f"SELECT COUNT(*) as cnt FROM `{self.project}.{self.dataset}.base_ftplog` "
-                f"WHERE gcs_uri = '{gcs_uri}'",
-                self.project
+                f"WHERE gcs_uri = '{gcs_uri}'"
+                f"{event_date_filter(event_dates[0], event_dates[-1])}",
+                self.bq_client,
+                until=lambda rows: bool(rows) and rows[0]['cnt'] > 0
             )
             
             if success:
-                try:
-                    result = json.loads(output)
-                    base_count = result[0]['cnt'] if result else 0
-                    log_info(f"Rows in base_ftplog: {base_count}")
-                except:
-                    pass
+                base_count = output[0]['cnt'] if output else 0
+                log_info(f"Rows in base_ftplog: {base_count}")
             
             log_success(f"File processed successfully: {rows_loaded} rows")
             return True
@@ -322,58 +421,50 @@ class TestIdempotency(PipelineTest):
         success, output = run_bq_query(
             f"SELECT gcs_uri, rows_loaded FROM `{self.project}.{self.dataset}.processed_files` "
             f"ORDER BY processed_timestamp DESC LIMIT 1",
-            self.project
+            self.bq_client
         )
         
         if not success:
             log_error(f"Failed to get processed file: {output}")
             return False
         
-        try:
-            result = json.loads(output)
-            if not result:
-                log_warning("No processed files found - skipping idempotency test")
-                return True
-            
-            test_uri = result[0]['gcs_uri']
-            original_rows = result[0]['rows_loaded']
-        except:
-            log_error("Failed to parse processed files")
-            return False
+        if not output:
+            log_warning("No processed files found - skipping idempotency test")
+            return True
+        
+        test_uri = output[0]['gcs_uri']
+        original_rows = output[0]['rows_loaded']
         
-        # Get row count in base table
+        # Get row count in base table, plus the file's event date range so the
+        # re-check after the ETL only scans those partitions
         success, output = run_bq_query(
-            f"SELECT COUNT(*) as cnt FROM `{self.project}.{self.dataset}.base_ftplog` "
+            f"SELECT COUNT(*) as cnt, "
+            f"MIN(DATE(event_dt)) as min_date, MAX(DATE(event_dt)) as max_date "
+            f"FROM `{self.project}.{self.dataset}.base_ftplog` "
             f"WHERE gcs_uri = '{test_uri}'",
-            self.project
+            self.bq_client
         )
         
-        try:
-            result = json.loads(output)
-            before_count = result[0]['cnt'] if result else 0
-        except:
-            before_count = 0
+        row = output[0] if success and output else {}
+        before_count = row.get('cnt', 0)
+        date_filter = event_date_filter(row.get('min_date'), row.get('max_date'))
         
         # Run ETL again
         log_info("Re-running ETL...")
-        sql_path = os.path.join(
-            os.path.dirname(__file__), 
-            '..', 'sql', '06_scheduled_query_etl.sql'
-        )
-        run_command(f'bq query --use_legacy_sql=false --project_id={self.project} < {sql_path}')
+        success, output = run_etl(self.bq_client, self.project, self.dataset)
+        
+        if not success:
+            log_error(f"ETL failed: {output}")
+            return False
         
         # Check row count again
         success, output = run_bq_query(
             f"SELECT COUNT(*) as cnt FROM `{self.project}.{self.dataset}.base_ftplog` "
-            f"WHERE gcs_uri = '{test_uri}'",
-            self.project
+            f"WHERE gcs_uri = '{test_uri}'{date_filter}",
+            self.bq_client
         )
         
-        try:
-            result = json.loads(output)
-            after_count = result[0]['cnt'] if result else 0
-        except:
-            after_count = 0
+        after_count = output[0]['cnt'] if success and output else 0
         
         if before_count == after_count:
             log_success(f"Idempotency verified: {before_count} rows (no duplicates)")
@@ -383,6 +474,47 @@ class TestIdempotency(PipelineTest):
             return False
 
 
+def print_test_header(name: str):
+    print(f"\n{Colors.BOLD}Test: {name}{Colors.RESET}")
+    print("-" * 40)
+
+
+def run_test(
+    test_class: type,
+    project: str,
+    bucket: str,
+    dataset: str,
+    storage_client: "storage.Client",
+    bq_client: "bigquery.Client",
+    capture: bool = False
+) -> Tuple[bool, List[str]]:
+    """Run a single test through setup/run/teardown.
+
+    Returns whether it passed, plus its log lines when ``capture`` is set
+    (otherwise lines are printed as they happen and the list is empty).
+    """
+    _log_capture.lines = [] if capture else None
+    test = test_class()
+    test.configure(
+        project, bucket, dataset,
+        storage_client=storage_client, bq_client=bq_client
+    )
+    try:
+        test.setup()
+        passed = test.run()
+    except Exception as e:
+        log_error(f"Test raised exception: {e}")
+        passed = False
+    finally:
+        try:
+            test.teardown()
+        except Exception as e:
+            log_warning(f"Test teardown failed: {e}")
+    lines = _log_capture.lines or []
+    _log_capture.lines = None
+    return passed, lines
+
+
 def run_all_tests(project: str, bucket: str, dataset: str) -> bool:
     """Run all tests and return overall success status."""
     
@@ -395,34 +527,51 @@ def run_all_tests(project: str, bucket: str, dataset: str) -> bool:
     print(f"Time:    {datetime.now().isoformat()}")
     print(f"{'='*60}\n")
     
-    tests = [
+    if storage is None or bigquery is None:
+        log_error(
+            "google-cloud-storage and google-cloud-bigquery are required "
+            "(pip install google-cloud-storage google-cloud-bigquery)"
+        )
+        return False
+    
+    # One client of each kind for the whole run, so auth and the HTTP
+    # sessions are reused
+    storage_client = storage.Client(project=project)
+    bq_client = bigquery.Client(project=project)
+    
+    # Connectivity checks are independent and network-bound, so they run
+    # concurrently; file processing and idempotency share ETL state and run
+    # afterwards in order
+    parallel_tests = [
         ("GCS Connectivity", TestGCSConnectivity),
         ("BigQuery Connectivity", TestBigQueryConnectivity),
         ("External Table", TestExternalTable),
+    ]
+    serial_tests = [
         ("File Processing", TestFileProcessing),
         ("Idempotency", TestIdempotency),
     ]
+    clients = (storage_client, bq_client)
     
     results = []
     
-    for name, test_class in tests:
-        print(f"\n{Colors.BOLD}Test: {name}{Colors.RESET}")
-        print("-" * 40)
-        
-        test = test_class()
-        test.configure(project, bucket, dataset)
-        try:
-            test.setup()
-            passed = test.run()
+    with ThreadPoolExecutor(max_workers=len(parallel_tests)) as executor:
+        futures = [
+            executor.submit(run_test, test_class, project, bucket, dataset, *clients, True)
+            for _, test_class in parallel_tests
+        ]
+        # Print in declaration order, each test's output as one block
+        for (name, _), future in zip(parallel_tests, futures):
+            passed, lines = future.result()
+            print_test_header(name)
+            for line in lines:
+                print(line)
             results.append((name, passed))
-        except Exception as e:
-            log_error(f"Test raised exception: {e}")
-            results.append((name, False))
-        finally:
-            try:
-                test.teardown()
-            except:
-                pass
+    
+    for name, test_class in serial_tests:
+        print_test_header(name)
+        passed, _ = run_test(test_class, project, bucket, dataset, *clients)
+        results.append((name, passed))
     
     # Summary
     print(f"\n{Colors.BOLD}{'='*60}{Colors.RESET}")
@@ -7,10 +7,19 @@ the ETL's JSON_VALUE / SAFE_CAST assumptions.
 """
 import argparse
 import json
+import os
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 from pathlib import Path
 import sys
 
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:  # orjson is optional; the stdlib parser also accepts bytes
+    orjson = None
+    _json_loads = json.loads
+
 
 REQUIRED_KEYS = [
     "UserName",
@@ -24,11 +33,15 @@ REQUIRED_KEYS = [
     "Bytes",
     "StatusCode",
 ]
+# Set form for the per-line check; difference() against a dict is one C call
+REQUIRED_KEY_SET = frozenset(REQUIRED_KEYS)
 
 
 def parse_eventdt(v: str):
     # Our ETL uses SAFE.PARSE_TIMESTAMP('%Y-%m-%dT%H:%M:%E*S', ...)
     # Python's fromisoformat handles YYYY-MM-DDTHH:MM:SS and fractional seconds.
+    # It stays the only parser (no optional ciso8601) so a line's verdict does
+    # not depend on which packages are installed.
     if v.endswith("Z"):
         v = v.replace("Z", "+00:00")
     return datetime.fromisoformat(v)
@@ -36,24 +49,28 @@ def parse_eventdt(v: str):
 
 def validate_file(path: Path):
     summary = {"file": str(path), "lines": 0, "ok": 0, "errors": 0, "examples": []}
-    with path.open("r", encoding="utf-8") as f:
+    # Lines are parsed as bytes, skipping a str decode per line; invalid
+    # UTF-8 then surfaces as a per-line json error instead of aborting the file
+    with path.open("rb") as f:
         for i, raw in enumerate(f, start=1):
             raw = raw.strip()
             if not raw:
                 continue
             summary["lines"] += 1
             try:
-                obj = json.loads(raw)
+                obj = _json_loads(raw)
             except Exception as e:
                 summary["errors"] += 1
                 if len(summary["examples"]) < 3:
                     summary["examples"].append({"line": i, "error": f"json:{e}"})
                 continue
 
-            missing = [k for k in REQUIRED_KEYS if k not in obj]
+            missing = REQUIRED_KEY_SET.difference(obj)
             if missing:
                 summary["errors"] += 1
                 if len(summary["examples"]) < 3:
+                    # Report in REQUIRED_KEYS order so the output is stable
+                    missing = [k for k in REQUIRED_KEYS if k in missing]
                     summary["examples"].append({"line": i, "error": f"missing:{missing}"})
                 continue
 
@@ -91,21 +108,26 @@ def validate_file(path: Path):
 
 
 def find_samples(base: Path):
-    # Look for Waystar-*.json in base and top-level NDJSON files
-    candidates = list(base.glob("Waystar-*.json")) + list(base.glob("*.ndjson")) + list(base.glob("*.json"))
-    # de-duplicate preserving order
-    seen = set()
-    out = []
-    for p in candidates:
-        if p not in seen:
-            seen.add(p)
-            out.append(p)
-    return out
+    # Look for Waystar-*.json in base and top-level NDJSON files, listed in
+    # that order. One directory scan with plain string checks replaces three
+    # glob passes; each file lands in exactly one group, so no de-dup needed.
+    waystar, ndjson, other_json = [], [], []
+    with os.scandir(base) as entries:
+        for entry in entries:
+            name = entry.name
+            if not entry.is_file():
+                continue
+            if name.endswith(".json"):
+                (waystar if name.startswith("Waystar-") else other_json).append(Path(entry.path))
+            elif name.endswith(".ndjson"):
+                ndjson.append(Path(entry.path))
+    return waystar + ndjson + other_json
 
 
 def main():
     ap = argparse.ArgumentParser()
     ap.add_argument("files", nargs="*", help="NDJSON files to validate (defaults to auto-discovery)")
+    ap.add_argument("--workers", "-w", type=int, default=None, help="Number of worker processes (default: CPU count)")
     args = ap.parse_args()
 
     base = Path.cwd()
@@ -118,14 +140,24 @@ def main():
         print("No sample files found in current directory. Provide paths on the CLI.")
         sys.exit(2)
 
-    results = []
-    total_lines = total_ok = total_errors = 0
+    existing = []
     for p in paths:
         if not p.exists():
             print(f"Skipping missing file: {p}")
             continue
-        s = validate_file(p)
-        results.append(s)
+        existing.append(p)
+
+    # Files are independent and parsing is CPU-bound, so spread them across
+    # processes; map() keeps results in input order for stable output
+    max_workers = max(1, min(len(existing), args.workers or os.cpu_count() or 1))
+    if max_workers == 1:
+        results = [validate_file(p) for p in existing]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            results = list(executor.map(validate_file, existing))
+
+    total_lines = total_ok = total_errors = 0
+    for s in results:
         total_lines += s["lines"]
         total_ok += s["ok"]
         total_errors += s["errors"]